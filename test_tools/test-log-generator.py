@@ -14,14 +14,47 @@ Supports different volume modes:
 import argparse
 import signal
 import sys
+import threading
 import time
 from datetime import datetime
 import random
 import os
+import errno
 
-# Global file handles - supports single or multiple files
-log_files = []  # List of (path, file_handle) tuples
+# liburing is optional and only needed for --io-uring
+try:
+    import liburing
+except ImportError:
+    liburing = None
+
+# Global file descriptors - supports single or multiple files
+log_files = []  # List of (path, fd) tuples
 log_paths = []  # List of paths for cleanup
+uring = None    # UringWriter when running with --io-uring
+sync_writes = False  # fdatasync() every file after each batch (--fsync)
+# macOS has no fdatasync(); a full fsync() is the nearest equivalent there
+fdatasync = getattr(os, 'fdatasync', os.fsync)
+entry_count = 0  # Entries generated so far, read by the progress reporter thread
+shutting_down = False  # Set once by cleanup_and_exit, also stops the reporter
+
+# Pending entries are batched and written to each file with one writev() per fd
+# once either trigger fires (same dual-trigger idea as Flicker's own buffer)
+FLUSH_BYTES = 256 * 1024    # Flush once the arena can't fit the next entry
+FLUSH_INTERVAL_SEC = 0.1    # ...or before pending data would get older than this
+
+# Every file gets identical content, so entries are encoded once into a single
+# preallocated arena that is reused for every batch
+arena = bytearray(FLUSH_BYTES)
+arena_len = 0   # Bytes of arena currently pending
+
+# time.sleep() overshoots by ~70-130us with a lot of jitter, which matters for
+# short delays. When the minimum delay is below SPIN_BELOW_DELAY_MS, sleep all
+# but the last SPIN_MARGIN_SEC of each wait and busy-wait the rest
+SPIN_BELOW_DELAY_MS = 20
+SPIN_MARGIN_SEC = 0.0005
+
+# Signals that trigger cleanup_and_exit()
+SHUTDOWN_SIGNALS = {signal.SIGINT, signal.SIGTERM}
 
 # Volume presets (min_delay_ms, max_delay_ms)
 VOLUME_PRESETS = {
@@ -33,13 +66,28 @@ VOLUME_PRESETS = {
 
 def cleanup_and_exit(signum=None, frame=None):
     """Clear all log files and exit gracefully"""
+    global shutting_down
+    # Only shut down once: a second Ctrl+C/SIGTERM (e.g. from test-e2e.sh's
+    # cleanup trap) just returns instead of re-entering. No locks are taken
+    # here, since the handler can interrupt code that holds them
+    if shutting_down:
+        return
+    shutting_down = True
+
     print("\n\n[SHUTDOWN] Received interrupt signal")
     print(f"[SHUTDOWN] Clearing {len(log_paths)} log file(s)...")
 
+    # Let in-flight io_uring writes finish before closing their fds
+    if uring is not None:
+        uring.close()
+
     # Close all open files
-    for path, file_handle in log_files:
-        if file_handle and not file_handle.closed:
-            file_handle.close()
+    for path, fd in log_files:
+        try:
+            os.close(fd)
+        except OSError:
+            pass  # Already closed
+    log_files.clear()
 
     # Clear all files
     for path in log_paths:
@@ -54,42 +102,279 @@ def cleanup_and_exit(signum=None, frame=None):
     sys.exit(0)
 
 
-def generate_log_entry():
-    """Generate a realistic-looking log entry"""
-    log_types = [
-        "INFO",
-        "WARN",
-        "ERROR",
-        "DEBUG",
-    ]
-
-    messages = [
-        "Application started successfully",
-        "Processing user request",
-        "Database query completed in {}ms",
-        "Cache hit for key: user_{}",
-        "HTTP request: GET /api/v1/users",
-        "Authentication successful for user_{}",
-        "Background job completed",
-        "Memory usage: {}MB",
-        "Connection established to database",
-        "API response time: {}ms",
-    ]
-
-    level = random.choice(log_types)
-    message = random.choice(messages)
+# Levels are stored already padded to the 5-character column width
+LOG_LEVELS = [level.ljust(5) for level in (
+    b"INFO",
+    b"WARN",
+    b"ERROR",
+    b"DEBUG",
+)]
+
+MESSAGES = [
+    "Application started successfully",
+    "Processing user request",
+    "Database query completed in {}ms",
+    "Cache hit for key: user_{}",
+    "HTTP request: GET /api/v1/users",
+    "Authentication successful for user_{}",
+    "Background job completed",
+    "Memory usage: {}MB",
+    "Connection established to database",
+    "API response time: {}ms",
+]
+
+# Level/message picks are drawn from the PRNG this many at a time
+CHOICE_BATCH = 256
+
+
+def make_message_builder(message):
+    """Classify a message template once and return a callable that fills it in as bytes"""
+    if '{}' not in message:
+        message = message.encode('utf-8')
+        return lambda: message
 
     # Add random numbers to some messages
-    if '{}' in message:
-        if 'ms' in message:
-            message = message.format(random.randint(10, 500))
-        elif 'MB' in message:
-            message = message.format(random.randint(100, 2000))
-        else:
-            message = message.format(random.randint(1000, 9999))
+    if 'ms' in message:
+        low, high = 10, 500
+    elif 'MB' in message:
+        low, high = 100, 2000
+    else:
+        low, high = 1000, 9999
+
+    # random() scaled by hand skips randint()'s pure-Python argument checking
+    prefix, suffix = (part.encode('utf-8') for part in message.split('{}'))
+    span = high - low + 1
+    rand = random.random
+    return lambda: b"%s%d%s" % (prefix, low + int(rand() * span), suffix)
+
 
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-    return f"[{timestamp}] {level:5s} - {message}\n"
+MESSAGE_BUILDERS = [make_message_builder(message) for message in MESSAGES]
+
+
+def random_picks():
+    """Yield (level, message builder) pairs, drawn from the PRNG in batches"""
+    while True:
+        yield from zip(random.choices(LOG_LEVELS, k=CHOICE_BATCH),
+                       random.choices(MESSAGE_BUILDERS, k=CHOICE_BATCH))
+
+
+picks = random_picks()
+
+# The "YYYY-MM-DD HH:MM:SS" part of the timestamp only changes once a second,
+# and the ".mmm] " part that follows it is looked up from a table
+ts_sec = 0
+ts_prefix = b''
+MS_SUFFIXES = [b".%03d] " % ms for ms in range(1000)]
+
+
+def generate_log_entry():
+    """Generate a realistic-looking log entry, already encoded as bytes"""
+    global ts_sec, ts_prefix
+    level, build_message = next(picks)
+
+    t = time.time()
+    sec = int(t)
+    if sec != ts_sec:
+        ts_prefix = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(sec)).encode('ascii')
+        ts_sec = sec
+    return b"".join((b"[", ts_prefix, MS_SUFFIXES[int(t * 1000) % 1000], level, b" - ", build_message(), b"\n"))
+
+
+def sleep_until(deadline, spin=False):
+    """Sleep until the given time.monotonic() deadline, busy-waiting the tail of the wait if requested"""
+    remaining = deadline - time.monotonic()
+    if not spin:
+        if remaining > 0:
+            time.sleep(remaining)
+        return
+
+    if remaining > SPIN_MARGIN_SEC:
+        time.sleep(remaining - SPIN_MARGIN_SEC)
+    while time.monotonic() < deadline:
+        pass
+
+
+class UringWriter:
+    """Writes a batch to every file with one io_uring submission instead of one syscall per file"""
+
+    # Each SQE's user_data holds its file index, with this bit set on fsyncs
+    FSYNC_TAG = 1 << 32
+
+    def __init__(self, fds, sqpoll=False, fsync=False):
+        self.ring = liburing.Ring()
+        self.cqe = liburing.Cqe()
+        self.fds = list(fds)
+        self.fsync = fsync
+        self.in_flight = []  # Buffers referenced by submitted SQEs, kept alive until reaped
+        self.pending_cqes = 0
+        self.closed = False
+        # With SQPOLL a kernel thread picks up new SQEs, so io_uring_submit() only
+        # enters the kernel to wake it after it has gone idle
+        flags = liburing.IORING_SETUP_SQPOLL if sqpoll else 0
+        sqes_per_file = 2 if fsync else 1
+        liburing.io_uring_queue_init(max(8, len(fds) * sqes_per_file), self.ring, flags)
+
+        # Registered files are addressed by index with IOSQE_FIXED_FILE, which skips
+        # the kernel's per-SQE fd lookup and reference counting. The FileIndex
+        # has to stay referenced for as long as the ring uses it
+        self.files = liburing.FileIndex(fds)
+        liburing.io_uring_register_files(self.ring, self.files)
+        self.num_files = len(fds)
+
+    def submit(self, data):
+        """Queue a write of data to every registered file and submit them all with a single io_uring_enter"""
+        # Hold off the shutdown handler until the ring's bookkeeping matches what
+        # was actually submitted, or close() could wait for CQEs that never come.
+        # This only works because the reporter thread blocks these signals too,
+        # so the kernel can't hand them to a thread that would let them through
+        old_mask = signal.pthread_sigmask(signal.SIG_BLOCK, SHUTDOWN_SIGNALS)
+        try:
+            self._submit(data)
+        finally:
+            signal.pthread_sigmask(signal.SIG_SETMASK, old_mask)
+
+    def _submit(self, data):
+        # Writes to the same file must not overlap, or they could land out of order
+        self.wait()
+        self.in_flight.append(data)
+        write_flags = liburing.IOSQE_FIXED_FILE
+        if self.fsync:
+            # Linked so the kernel only starts the fdatasync once the write is done
+            write_flags |= liburing.IOSQE_IO_LINK
+
+        for index in range(self.num_files):
+            sqe = liburing.io_uring_get_sqe(self.ring)
+            liburing.io_uring_prep_write(sqe, index, data)
+            liburing.io_uring_sqe_set_flags(sqe, write_flags)
+            liburing.io_uring_sqe_set_data64(sqe, index)
+            if self.fsync:
+                sqe = liburing.io_uring_get_sqe(self.ring)
+                liburing.io_uring_prep_fsync(sqe, index, liburing.IORING_FSYNC_DATASYNC)
+                liburing.io_uring_sqe_set_flags(sqe, liburing.IOSQE_FIXED_FILE)
+                liburing.io_uring_sqe_set_data64(sqe, index | self.FSYNC_TAG)
+        liburing.io_uring_submit(self.ring)
+        self.pending_cqes = self.num_files * (2 if self.fsync else 1)
+        self.reap()
+
+    def reap(self):
+        """Collect completed writes without blocking"""
+        while self.pending_cqes:
+            try:
+                liburing.io_uring_peek_cqe(self.ring, self.cqe)
+            except BlockingIOError:
+                return
+            self._complete()
+
+    def wait(self):
+        """Block until every submitted write has completed"""
+        while self.pending_cqes:
+            liburing.io_uring_wait_cqe(self.ring, self.cqe)
+            self._complete()
+        self.in_flight.clear()
+
+    def _complete(self):
+        user_data = self.cqe[0].user_data
+        try:
+            res = self.cqe[0].res
+        except OSError as e:  # The binding raises for negative (-errno) results
+            res = -e.errno
+        # Count the CQE before releasing it, so a re-entrant wait() from the
+        # shutdown handler never waits for a completion that was already reaped
+        self.pending_cqes -= 1
+        liburing.io_uring_cqe_seen(self.ring, self.cqe[0])
+        index = user_data & ~self.FSYNC_TAG
+
+        if user_data & self.FSYNC_TAG:
+            # A short write breaks the link and cancels its fsync; the write's
+            # own completion below finishes and syncs the file instead
+            if res < 0 and res != -errno.ECANCELED:
+                raise OSError(-res, f"io_uring fsync failed: {os.strerror(-res)}")
+            return
+
+        if res < 0:
+            raise OSError(-res, f"io_uring write failed: {os.strerror(-res)}")
+        data = self.in_flight[-1]
+        if res < len(data):
+            # Short write: finish the batch synchronously so no entries are lost
+            fd = self.fds[index]
+            remaining = memoryview(data)[res:]
+            while remaining:
+                remaining = remaining[os.write(fd, remaining):]
+            if self.fsync:
+                fdatasync(fd)
+
+    def close(self):
+        """Wait for outstanding writes and tear down the ring (safe to call more than once)"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.wait()
+        finally:
+            liburing.io_uring_queue_exit(self.ring)
+
+
+def queue_entry(entry):
+    """Copy an encoded entry into the arena, flushing first if it doesn't fit"""
+    global arena_len
+    if arena_len + len(entry) > len(arena):
+        flush_pending()
+    end = arena_len + len(entry)
+    arena[arena_len:end] = entry
+    arena_len = end
+
+
+def flush_pending():
+    """Write the pending arena bytes to every file with a single writev() each (or one io_uring submission)"""
+    global arena_len
+    if not arena_len:
+        return
+
+    with memoryview(arena)[:arena_len] as pending:
+        if uring is not None:
+            # The arena is reused before the writes complete, so submit a snapshot
+            data = bytes(pending)
+            uring.submit(data)
+        else:
+            # splice()/sendfile()/copy_file_range() can't be used to fan this out
+            # in-kernel: all three reject O_APPEND targets, and O_APPEND is what
+            # keeps appends correct if something else truncates or writes the files
+            iov = [pending]  # One gather list shared by every fd, nothing is copied per file
+            for path, fd in log_files:
+                written = os.writev(fd, iov)
+                # Finish a short write (e.g. interrupted by a signal) so the batch stays whole
+                while written < arena_len:
+                    written += os.write(fd, pending[written:])
+                if sync_writes:
+                    fdatasync(fd)
+    arena_len = 0
+
+
+def report_progress(interval_sec):
+    """Print generation progress every interval_sec, off the generation loop's hot path"""
+    # Leave shutdown signals to the main thread, which blocks them while it
+    # submits io_uring writes (see UringWriter.submit)
+    signal.pthread_sigmask(signal.SIG_BLOCK, SHUTDOWN_SIGNALS)
+    num_files = len(log_files)  # Read once: shutdown clears log_files under us
+    start_time = last_time = time.monotonic()
+    last_count = 0
+    while True:
+        time.sleep(interval_sec)
+        if shutting_down:
+            return
+        count = entry_count
+        if count == last_count:
+            continue
+
+        now = time.monotonic()
+        rate = (count - last_count) / (now - last_time)
+        avg_rate = count / (now - start_time)
+        total_lines = count * num_files
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] "
+              f"Written {count} entries ({total_lines} total lines across {num_files} files, "
+              f"{rate:.1f} entries/sec, {avg_rate:.1f} avg)")
+        sys.stdout.flush()
+        last_time, last_count = now, count
 
 
 def parse_args():
@@ -109,6 +394,9 @@ Examples:
   %(prog)s --delay 250            # Custom 250ms delay between entries
   %(prog)s --path /tmp/app.log    # Write to custom path
   %(prog)s --multi-file 5         # Write to test1.log through test5.log
+  %(prog)s --multi-file 5 --io-uring  # Batch writes through io_uring (needs liburing)
+  %(prog)s --multi-file 5 --sqpoll    # io_uring with a kernel submission thread
+  %(prog)s --volume low --fsync       # Make every batch durable before the next one
         """
     )
 
@@ -139,14 +427,39 @@ Examples:
         help='Write to N files (test1.log, test2.log, ..., testN.log) instead of single file'
     )
 
+    parser.add_argument(
+        '--io-uring',
+        action='store_true',
+        help='Submit each batch of writes to all files through io_uring (Linux, requires the liburing package)'
+    )
+
+    parser.add_argument(
+        '--sqpoll',
+        action='store_true',
+        help='Use io_uring with a kernel SQ polling thread so submissions need no syscall (implies --io-uring, Linux 5.11+)'
+    )
+
+    parser.add_argument(
+        '--fsync',
+        action='store_true',
+        help='fdatasync() every file after each batch (with io_uring, as a write SQE linked to an fsync SQE)'
+    )
+
     return parser.parse_args()
 
 
 def main():
     """Main log generation loop"""
-    global log_files, log_paths
+    global log_files, log_paths, uring, entry_count, sync_writes
 
     args = parse_args()
+    if args.sqpoll:
+        args.io_uring = True
+    sync_writes = args.fsync
+
+    if args.io_uring and liburing is None:
+        print("[ERROR] --io-uring requires the liburing package (pip install liburing)", file=sys.stderr)
+        sys.exit(1)
 
     # Determine which files to write to
     if args.multi_file:
@@ -168,8 +481,8 @@ def main():
         mode_desc = f"{args.volume} volume ({min_delay_ms}-{max_delay_ms}ms delay)"
 
     # Register signal handlers for graceful shutdown
-    signal.signal(signal.SIGINT, cleanup_and_exit)
-    signal.signal(signal.SIGTERM, cleanup_and_exit)
+    for shutdown_signal in SHUTDOWN_SIGNALS:
+        signal.signal(shutdown_signal, cleanup_and_exit)
 
     print("="*80)
     print("Flicker Test Log Generator")
@@ -185,40 +498,52 @@ def main():
     print("="*80)
     print()
 
-    # Open all log files in append mode
+    # Open all log files in append mode (raw fds, batching is done here)
     for path in log_paths:
         try:
-            file_handle = open(path, 'a', buffering=1)  # Line buffered
-            log_files.append((path, file_handle))
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            log_files.append((path, fd))
         except Exception as e:
             print(f"[ERROR] Failed to open {path}: {e}", file=sys.stderr)
             sys.exit(1)
 
-    entry_count = 0
-    start_time = time.time()
+    if args.io_uring:
+        try:
+            uring = UringWriter([fd for path, fd in log_files], sqpoll=args.sqpoll, fsync=args.fsync)
+        except OSError as e:
+            print(f"[ERROR] Failed to set up io_uring: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    # Print progress every second (or every 5 seconds outside high volume mode)
+    report_interval_sec = 1.0 if args.volume == 'high' else 5.0
+    threading.Thread(target=report_progress, args=(report_interval_sec,), daemon=True).start()
+
+    last_flush = time.monotonic()
+    next_tick = last_flush
+    spin = min_delay_ms < SPIN_BELOW_DELAY_MS
 
     try:
         while True:
-            # Generate and write log entry to ALL files
-            entry = generate_log_entry()
-            for path, file_handle in log_files:
-                file_handle.write(entry)
+            # Generate log entry and queue it for ALL files
+            queue_entry(generate_log_entry())
 
             entry_count += 1
 
-            # Print progress every 10 entries (or every 50 in high volume mode)
-            report_interval = 10 if args.volume != 'high' else 50
-            if entry_count % report_interval == 0:
-                elapsed = time.time() - start_time
-                rate = entry_count / elapsed if elapsed > 0 else 0
-                total_lines = entry_count * len(log_files)
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] "
-                      f"Written {entry_count} entries ({total_lines} total lines across {len(log_files)} files, {rate:.1f} entries/sec)")
-                sys.stdout.flush()
-
-            # Sleep with configured delay
-            delay_sec = random.uniform(min_delay_ms, max_delay_ms) / 1000.0
-            time.sleep(delay_sec)
+            # Schedule the next entry relative to the previous deadline rather than
+            # to now, so sleep overshoot doesn't accumulate and drag the rate down
+            now = time.monotonic()
+            next_tick += random.uniform(min_delay_ms, max_delay_ms) / 1000.0
+            if next_tick < now - 1.0:
+                next_tick = now  # Fell far behind (e.g. process was stopped), don't burst
+
+            # Flush if the entries would go stale while sleeping (a full arena
+            # is flushed by queue_entry)
+            if next_tick - last_flush >= FLUSH_INTERVAL_SEC:
+                flush_pending()
+                last_flush = now
+
+            # Sleep until the next entry is due
+            sleep_until(next_tick, spin)
 
     except KeyboardInterrupt:
         # This should be caught by signal handler, but just in case
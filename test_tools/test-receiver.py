@@ -2,17 +2,105 @@
 """
 Simple HTTP server to receive and display Flicker log batches.
 Listens on port 8000 and prints received log entries to stdout.
+Each connection is handled on its own thread and kept alive (HTTP/1.1).
 """
 
 import json
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from datetime import datetime
 import sys
+import threading
+
+# orjson is optional: it parses straight from any buffer and is much faster on
+# large batches, but the stdlib json module works just as well
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+else:
+    def json_loads(data):
+        """Parse JSON from a bytes-like object (json.loads() won't take a memoryview)"""
+        return json.loads(bytes(data))
+
+    def json_dumps(obj):
+        """Serialize obj to UTF-8 encoded JSON bytes"""
+        return json.dumps(obj).encode('utf-8')
+
+# ijson is optional too: with it, very large batches are
+# decoded and printed entry by entry while they are still being received
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+# Handler threads print under this lock so writes don't interleave mid-line
+print_lock = threading.Lock()
+
+# Each batch is formatted up front and printed with a single write; streamed
+# batches are written this many entries at a time
+STREAM_PRINT_CHUNK = 1000
+RULE = '=' * 80
+
+# Request bodies are read into a buffer that each handler thread reuses across
+# requests on its connection. It starts at the first body's size and at least
+# doubles whenever a bigger body arrives
+body_buffers = threading.local()
+
+# Bodies larger than this are streamed through ijson when it is installed
+STREAM_THRESHOLD_BYTES = 1 << 20
+
+# Status page served for every GET, encoded once
+STATUS_HTML = """
+<html>
+<head><title>Flicker Test Receiver</title></head>
+<body>
+    <h1>Flicker Test Receiver</h1>
+    <p>Status: <span style="color: green;">Running</span></p>
+    <p>Listening for POST requests on /ingest</p>
+    <p>Check the terminal for received log entries.</p>
+</body>
+</html>
+""".encode('utf-8')
+
+
+def format_entry(i, entry):
+    """Format one received log entry as an output line"""
+    return f"{i:3d}. [{entry.get('path', 'unknown')}] {entry.get('line', '')}\n"
+
+
+def write_output(text):
+    """Write text to stdout in one call and flush it"""
+    with print_lock:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+
+class BodyReader:
+    """File-like wrapper around a request body that never reads past Content-Length"""
+
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.read(size)
+        self.remaining -= len(data)
+        return data
 
 
 class FlickerReceiver(BaseHTTPRequestHandler):
     """HTTP request handler that receives and displays log batches from Flicker"""
 
+    # Keep connections open between batches instead of reconnecting for each one
+    protocol_version = 'HTTP/1.1'
+
     def log_message(self, format, *args):
         """Override to customize server logging"""
         # Only log errors, not every request
@@ -29,14 +117,22 @@ class FlickerReceiver(BaseHTTPRequestHandler):
                 self.send_error(400, "Empty request body")
                 return
 
+            # Stream very large batches instead of buffering the whole body
+            if ijson is not None and content_length > STREAM_THRESHOLD_BYTES and self.body_is_array():
+                self.receive_streamed(content_length)
+                return
+
             # Read and parse JSON body
-            body = self.rfile.read(content_length)
+            body = self.read_body(content_length)
+            if body is None:
+                self.send_error(400, "Incomplete request body")
+                return
 
             try:
-                data = json.loads(body.decode('utf-8'))
-            except json.JSONDecodeError as e:
+                data = json_loads(body)
+            except json.JSONDecodeError as e:  # orjson's error subclasses this
                 print(f"[ERROR] Invalid JSON: {e}")
-                print(f"[ERROR] Raw body: {body[:200]}")  # Print first 200 bytes
+                print(f"[ERROR] Raw body: {bytes(body[:200])}")  # Print first 200 bytes
                 self.send_error(400, f"Invalid JSON: {e}")
                 return
 
@@ -46,24 +142,12 @@ class FlickerReceiver(BaseHTTPRequestHandler):
             # Handle both single entry and batch formats
             entries = data if isinstance(data, list) else [data]
 
-            print(f"\n{'='*80}")
-            print(f"[{timestamp}] Received batch of {len(entries)} log entries:")
-            print(f"{'='*80}")
+            output = [f"\n{RULE}\n[{timestamp}] Received batch of {len(entries)} log entries:\n{RULE}\n"]
+            output.extend(format_entry(i, entry) for i, entry in enumerate(entries, 1))
+            output.append(f"{RULE}\n\n")
+            write_output(''.join(output))
 
-            for i, entry in enumerate(entries, 1):
-                path = entry.get('path', 'unknown')
-                line = entry.get('line', '')
-                print(f"{i:3d}. [{path}] {line}")
-
-            print(f"{'='*80}\n")
-            sys.stdout.flush()
-
-            # Send success response
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            response = json.dumps({"status": "ok", "received": len(entries)})
-            self.wfile.write(response.encode('utf-8'))
+            self.send_ok(len(entries))
 
         except Exception as e:
             print(f"[ERROR] Exception handling request: {e}")
@@ -71,24 +155,66 @@ class FlickerReceiver(BaseHTTPRequestHandler):
             traceback.print_exc()
             self.send_error(500, str(e))
 
+    def receive_streamed(self, content_length):
+        """Decode and print a large batch (a JSON array) entry by entry as it arrives"""
+        body = BodyReader(self.rfile, content_length)
+        timestamp = datetime.now().strftime('%H:%M:%S.%f')[:-3]
+        count = 0
+
+        # print_lock is only taken per chunk, so a slow upload never holds up
+        # other handlers (their output may land between this batch's chunks)
+        try:
+            output = [f"\n{RULE}\n[{timestamp}] Receiving streamed batch ({content_length} bytes):\n{RULE}\n"]
+            for count, entry in enumerate(ijson.items(body, 'item'), 1):
+                output.append(format_entry(count, entry))
+                if len(output) >= STREAM_PRINT_CHUNK:
+                    write_output(''.join(output))
+                    output.clear()
+
+            output.append(f"{RULE}\n[{timestamp}] Received streamed batch of {count} log entries\n{RULE}\n\n")
+            write_output(''.join(output))
+        except ijson.JSONError as e:
+            print(f"[ERROR] Invalid JSON after {count} entries: {e}")
+            self.close_connection = True  # Whatever is left of the body was never read
+            self.send_error(400, f"Invalid JSON: {e}")
+            return
+
+        self.send_ok(count)
+
+    def body_is_array(self):
+        """Check, without consuming anything, whether the request body starts with a JSON array"""
+        # Anything else (e.g. a single huge entry) goes through the buffered path
+        return self.rfile.peek(1).lstrip().startswith(b'[')
+
+    def send_ok(self, received):
+        """Send the success response for a batch of `received` entries"""
+        response = json_dumps({"status": "ok", "received": received})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def read_body(self, content_length):
+        """Read the request body into this thread's reusable buffer, returning a view of it (None if the client hung up early)"""
+        buf = getattr(body_buffers, 'buf', None)
+        if buf is None:
+            buf = body_buffers.buf = bytearray(content_length)
+        elif len(buf) < content_length:
+            buf = body_buffers.buf = bytearray(max(content_length, 2 * len(buf)))
+
+        body = memoryview(buf)[:content_length]
+        if self.rfile.readinto(body) < content_length:
+            return None
+        return body
+
     def do_GET(self):
         """Handle GET requests - just return a status page"""
         self.send_response(200)
         self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(STATUS_HTML)))
         self.end_headers()
-
-        html = """
-        <html>
-        <head><title>Flicker Test Receiver</title></head>
-        <body>
-            <h1>Flicker Test Receiver</h1>
-            <p>Status: <span style="color: green;">Running</span></p>
-            <p>Listening for POST requests on /ingest</p>
-            <p>Check the terminal for received log entries.</p>
-        </body>
-        </html>
-        """
-        self.wfile.write(html.encode('utf-8'))
+        self.wfile.write(STATUS_HTML)
 
 
 def main():
@@ -96,7 +222,7 @@ def main():
     host = '0.0.0.0'  # Listen on all interfaces
     port = 8000
 
-    server = HTTPServer((host, port), FlickerReceiver)
+    server = ThreadingHTTPServer((host, port), FlickerReceiver)
 
     print("="*80)
     print("Flicker Test Receiver")